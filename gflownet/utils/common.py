@@ -1,10 +1,11 @@
 import os
 import random
+from collections import OrderedDict
 from copy import deepcopy
-from functools import partial
+from functools import lru_cache, partial, singledispatch
 from os.path import expandvars
 from pathlib import Path
-from typing import List, Union
+from typing import List, Optional, Union
 
 import numpy as np
 import torch
@@ -15,7 +16,23 @@ from torchtyping import TensorType
 
 from gflownet.utils.policy import parse_policy_config
 
+# Availability of CUDA, probed once at import time
+_CUDA_AVAILABLE = torch.cuda.is_available()
 
+# Correspondence between precisions and torch data types
+_FLOAT_PRECISIONS = {
+    16: torch.float16,
+    32: torch.float32,
+    64: torch.float64,
+}
+_INT_PRECISIONS = {
+    16: torch.int16,
+    32: torch.int32,
+    64: torch.int64,
+}
+
+
+@lru_cache(maxsize=None)
 def set_device(device: Union[str, torch.device]):
     """
     Get `torch` device from device.
@@ -43,7 +60,7 @@ def set_device(device: Union[str, torch.device]):
     """
     if isinstance(device, torch.device):
         return device
-    if device.lower() == "cuda" and torch.cuda.is_available():
+    if device.lower() == "cuda" and _CUDA_AVAILABLE:
         return torch.device("cuda")
     else:
         return torch.device("cpu")
@@ -76,15 +93,11 @@ def set_float_precision(precision: Union[int, torch.dtype]):
     ValueError
         If precision is not one of [16, 32, 64].
     """
-    if isinstance(precision, torch.dtype):
-        return precision
-    if precision == 16:
-        return torch.float16
-    elif precision == 32:
-        return torch.float32
-    elif precision == 64:
-        return torch.float64
-    else:
+    try:
+        return _FLOAT_PRECISIONS[precision]
+    except (KeyError, TypeError):
+        if isinstance(precision, torch.dtype):
+            return precision
         raise ValueError("Precision must be one of [16, 32, 64]")
 
 
@@ -115,22 +128,23 @@ def set_int_precision(precision: Union[int, torch.dtype]):
     ValueError
         If precision is not one of [16, 32, 64].
     """
-    if isinstance(precision, torch.dtype):
-        return precision
-    if precision == 16:
-        return torch.int16
-    elif precision == 32:
-        return torch.int32
-    elif precision == 64:
-        return torch.int64
-    else:
+    try:
+        return _INT_PRECISIONS[precision]
+    except (KeyError, TypeError):
+        if isinstance(precision, torch.dtype):
+            return precision
         raise ValueError("Precision must be one of [16, 32, 64]")
 
 
+@singledispatch
 def torch2np(x):
     """
     Convert a torch tensor to a numpy array.
 
+    Tensors are detached and moved to the CPU if needed. Note that the returned array
+    shares memory with CPU tensors and input arrays are returned as is, that is no copy
+    is made. The conversion is dispatched on the type of the input.
+
     Parameters
     ----------
     x : Union[torch.Tensor, np.ndarray, list]
@@ -141,26 +155,43 @@ def torch2np(x):
     np.ndarray
         Converted data.
     """
-    if hasattr(x, "is_cuda") and x.is_cuda:
-        x = x.detach().cpu()
-    return np.array(x)
+    return np.asarray(x)
 
 
-def download_file_if_not_exists(path: str, url: str):
+@torch2np.register
+def _(x: torch.Tensor):
+    return x.detach().cpu().numpy()
+
+
+@torch2np.register
+def _(x: np.ndarray):
+    return x
+
+
+@lru_cache(maxsize=1)
+def _get_gdown():
     """
-    Download a file from google drive if path doestn't exist.
-    url should be in the format: https://drive.google.com/uc?id=FILE_ID
+    Import gdown lazily, since it is an optional dependency that is slow to import.
     """
     import gdown
 
+    return gdown
+
+
+def download_file_if_not_exists(path: str, url: str):
+    """
+    Download a file from google drive if path doestn't exist or is an empty file,
+    for example the result of an interrupted download.
+    url should be in the format: https://drive.google.com/uc?id=FILE_ID
+    """
     path = Path(path)
     if not path.is_absolute():
         # to avoid storing downloaded files with the logs, prefix is set to the original working dir
         prefix = get_original_cwd()
         path = Path(prefix) / path
-    if not path.exists():
+    if not (path.is_file() and path.stat().st_size > 0):
         path.absolute().parent.mkdir(parents=True, exist_ok=True)
-        gdown.download(url, str(path.absolute()), quiet=False)
+        _get_gdown().download(url, str(path.absolute()), quiet=False)
     return path
 
 
@@ -208,32 +239,92 @@ def find_latest_checkpoint(ckpt_dir):
     Raises
     ------
     ValueError
-        If no checkpoint files are found in the input directory.
+        If the input directory does not exist or no checkpoint files are found in it.
     """
     ckpt_dir = Path(ckpt_dir)
-    final = [f for f in ckpt_dir.glob(f"*final*")]
-    if len(final) > 0:
-        return final[0]
-    ckpts = [f for f in ckpt_dir.glob(f"iter_*")]
-    if not ckpts:
+    latest = None
+    if ckpt_dir.is_dir():
+        latest = _find_latest_checkpoint(ckpt_dir)
+    if latest is None:
         raise ValueError(
             f"No checkpoints found in {ckpt_dir} with pattern iter_* or *final*"
         )
-    return sorted(ckpts, key=lambda f: float(f.stem.split("iter_")[1]))[-1]
+    return latest
+
+
+def _find_latest_checkpoint(ckpt_dir):
+    """
+    Scan a checkpoints directory once and return the latest checkpoint, or None if no
+    checkpoint is found.
+    """
+    latest, latest_iter = None, -1
+    with os.scandir(ckpt_dir) as entries:
+        for entry in entries:
+            if "final" in entry.name:
+                return Path(entry.path)
+            if entry.name.startswith("iter_"):
+                try:
+                    iteration = int(Path(entry.name).stem.split("iter_")[1])
+                except ValueError:
+                    continue
+                if iteration > latest_iter:
+                    latest, latest_iter = Path(entry.path), iteration
+    return latest
+
+
+def _compose_hydra_config(hydra_dir, config_name):
+    """
+    Compose a Hydra config from the config directory hydra_dir.
+    """
+    with initialize_config_dir(version_base=None, config_dir=hydra_dir, job_name="xxx"):
+        return compose(config_name=config_name)
+
+
+@lru_cache(maxsize=32)
+def _compose_hydra_config_cached(hydra_dir, config_name, mtime):
+    """
+    Compose a Hydra config and cache the result.
+
+    The modification time of the config file is part of the cache key, so that the
+    config is composed again if the file is modified.
+    """
+    return _compose_hydra_config(hydra_dir, config_name)
 
 
 def read_hydra_config(rundir=None, config_name="config"):
+    """
+    Read a Hydra config, either from the `.hydra` directory of a run directory or from
+    the path in config_name if rundir is None.
+
+    Initializing Hydra is expensive, so the configs of run directories are cached and
+    a copy of the cached config is returned. The config of a run directory is
+    self-contained, so it is composed again only if it is modified. Configs read from
+    config_name are not cached, since they may include other config files through
+    their defaults list.
+
+    Parameters
+    ----------
+    rundir : Path, optional
+        Path to the run directory, by default None.
+    config_name : str, optional
+        Name of the config, or path to the config if rundir is None, by default
+        "config".
+
+    Returns
+    -------
+    DictConfig
+        The composed config.
+    """
     if rundir is None:
-        rundir = Path(config_name)
-        hydra_dir = rundir.parent
-        config_name = rundir.name
-    else:
-        hydra_dir = rundir / ".hydra"
+        config_path = Path(config_name).resolve()
+        return _compose_hydra_config(str(config_path.parent), config_path.name)
 
-    with initialize_config_dir(
-        version_base=None, config_dir=str(hydra_dir), job_name="xxx"
-    ):
-        return compose(config_name=config_name)
+    hydra_dir = (Path(rundir) / ".hydra").resolve()
+    config_path = hydra_dir / config_name
+    if config_path.suffix != ".yaml":
+        config_path = config_path.with_name(f"{config_path.name}.yaml")
+    mtime = config_path.stat().st_mtime_ns if config_path.exists() else None
+    return deepcopy(_compose_hydra_config_cached(str(hydra_dir), config_name, mtime))
 
 
 def gflownet_from_config(config, env=None):
@@ -283,15 +374,18 @@ def gflownet_from_config(config, env=None):
     # TOREVISE: set up proxy so when buffer calls it (when it creates train / test
     # dataset) it has the correct infro from env
     # proxy.setup(env)
+    # The buffer and evaluator configs do not contain objects to instantiate, so Hydra
+    # does not need to traverse them recursively
     buffer = instantiate(
         config.buffer,
         env=env,
         proxy=proxy,
         datadir=logger.datadir,
+        _recursive_=False,
     )
 
     # The evaluator is used to compute metrics and plots
-    evaluator = instantiate(config.evaluator)
+    evaluator = instantiate(config.evaluator, _recursive_=False)
 
     # The policy is used to model the probability of a forward/backward action
     forward_config = parse_policy_config(config, kind="forward")
@@ -360,9 +454,9 @@ def load_gflownet_from_rundir(
         Whether to disable wandb in the GFN init, by default True.
     print_config : bool, optional
         Whether to print the loaded config, by default False.
-    device : str, optional
-        Device to which the models should be moved. If None (default), take the device
-        from the loaded config.
+    device : Union[str, torch.device], optional
+        Device on which the GFlowNet agent should be created. If None (default), take
+        the device from the loaded config.
     load_last_checkpoint : bool, optional
         Whether to load the final models, by default True.
     is_resumed : bool, optional
@@ -382,17 +476,18 @@ def load_gflownet_from_rundir(
 
     # Read experiment config
     config = OmegaConf.load(Path(rundir) / ".hydra" / "config.yaml")
-    # Resolve variables
-    config = OmegaConf.to_container(config, resolve=True)
-    # Re-create OmegaCong DictConfig
-    config = OmegaConf.create(config)
+    # Resolve variables in place, without converting the config to a container
+    OmegaConf.resolve(config)
+    # The config is modified below, so it must not be in struct mode
+    OmegaConf.set_struct(config, False)
 
     if print_config:
         print(OmegaConf.to_yaml(config))
 
-    # Device
-    if device is None:
-        device = config.device
+    # Device: the GFlowNet agent is created directly on the requested device. The
+    # config only stores primitive types, so torch devices are stored by their type.
+    if device is not None:
+        config.device = set_device(device).type
 
     if no_wandb:
         # Disable wandb
@@ -404,7 +499,11 @@ def load_gflownet_from_rundir(
 
     if load_last_checkpoint:
         checkpoint_latest = find_latest_checkpoint(rundir / config.logger.logdir.ckpts)
-        checkpoint = torch.load(checkpoint_latest, map_location=set_device(device))
+        # The checkpoint is memory-mapped on the CPU: the tensors are only read when
+        # they are copied into the models of the agent, which are on its device.
+        checkpoint = torch.load(
+            checkpoint_latest, map_location="cpu", mmap=True, weights_only=False
+        )
 
         # Set run id in logger to enable WandB resume
         config.logger.run_id = checkpoint["run_id"]
@@ -438,11 +537,13 @@ def load_gflownet_from_rundir(
     return gflownet, config
 
 
-def batch_with_rest(start, stop, step, tensor=False):
+def batch_with_rest(start, stop, step, tensor=False, device=None):
     """
     Yields batches of indices from start to stop with step size. The last batch may be
     smaller than step.
 
+    The indices are allocated once and the batches are views of them.
+
     Parameters
     ----------
     start : int
@@ -454,17 +555,184 @@ def batch_with_rest(start, stop, step, tensor=False):
     tensor : bool, optional
         Whether to return a `torch` tensor of indices instead of a `numpy` array, by
         default False.
+    device : torch.device, optional
+        Device on which the `torch` tensor of indices is allocated, by default None
+        (default device). Ignored if tensor is False.
 
     Yields
     ------
     Union[np.ndarray, torch.Tensor]
         Batch of indices
     """
-    for i in range(start, stop, step):
-        if tensor:
-            yield torch.arange(i, min(i + step, stop))
-        else:
-            yield np.arange(i, min(i + step, stop))
+    stop = max(start, stop)
+    if tensor:
+        indices = torch.arange(start, stop, device=device)
+    else:
+        indices = np.arange(start, stop)
+    for i in range(0, stop - start, step):
+        yield indices[i : i + step]
+
+
+# Correspondence between torch and numpy data types, used to stage the conversion of
+# Python lists into tensors
+_TORCH_TO_NP = {
+    torch.float16: np.float16,
+    torch.float32: np.float32,
+    torch.float64: np.float64,
+    torch.int16: np.int16,
+    torch.int32: np.int32,
+    torch.int64: np.int64,
+    torch.bool: np.bool_,
+}
+
+# Pinned host buffers used to stack lists of CPU tensors before moving them to a CUDA
+# device, indexed by shape and data type. Each buffer is stored together with the CUDA
+# event recorded after its last transfer so that it is not overwritten while the
+# asynchronous copy is still in progress. The least recently used buffers are released
+# when either the number of buffers or their total size exceeds its limit, and larger
+# buffers are never kept.
+_PINNED_BUFFERS = OrderedDict()
+_PINNED_BUFFERS_MAX = 8
+_PINNED_BUFFERS_MAX_BYTES = 64 * 2**20
+
+
+def _stack_pinned_to(x, device, dtype):
+    """
+    Stack a list of CPU tensors into a reusable pinned buffer and move the result
+    asynchronously to a CUDA device.
+
+    Parameters
+    ----------
+    x : List[torch.Tensor]
+        List of CPU tensors with identical shape and data type.
+    device : torch.device
+        CUDA device to which the tensor should be moved.
+    dtype : torch.dtype
+        Data type to which the tensor should be converted.
+
+    Returns
+    -------
+    torch.Tensor
+        Stacked tensor on the device.
+    """
+    shape = (len(x),) + tuple(x[0].shape)
+    key = (shape, x[0].dtype)
+    if key in _PINNED_BUFFERS:
+        buffer, event = _PINNED_BUFFERS.pop(key)
+        event.synchronize()
+    else:
+        buffer = torch.empty(shape, dtype=x[0].dtype, pin_memory=True)
+    torch.stack(x, out=buffer)
+    tensor = buffer.to(device=device, dtype=dtype, non_blocking=True)
+    n_bytes = buffer.numel() * buffer.element_size()
+    if n_bytes <= _PINNED_BUFFERS_MAX_BYTES:
+        while _PINNED_BUFFERS and (
+            len(_PINNED_BUFFERS) >= _PINNED_BUFFERS_MAX
+            or _pinned_buffers_bytes() + n_bytes > _PINNED_BUFFERS_MAX_BYTES
+        ):
+            _PINNED_BUFFERS.popitem(last=False)
+        event = torch.cuda.Event()
+        event.record(torch.cuda.current_stream(device))
+        _PINNED_BUFFERS[key] = (buffer, event)
+    return tensor
+
+
+def _pinned_buffers_bytes():
+    """
+    Returns the total size in bytes of the cached pinned buffers.
+    """
+    return sum(
+        buffer.numel() * buffer.element_size() for buffer, _ in _PINNED_BUFFERS.values()
+    )
+
+
+def _is_cuda(device):
+    """
+    Returns True if the device is a CUDA device. None, which torch takes as the
+    current device, is not considered a CUDA device.
+    """
+    return device is not None and torch.device(device).type == "cuda"
+
+
+@singledispatch
+def _to_device_dtype(x, device, dtype):
+    """
+    Convert input to a tensor of the given type on the given device.
+
+    Common implementation of :py:func:`tfloat`, :py:func:`tlong`, :py:func:`tint` and
+    :py:func:`tbool`. If the input is a list of tensors, the tensors are stacked along
+    the first dimension. Numpy arrays are converted without copy with
+    :py:func:`torch.from_numpy` before being moved to the device. Lists of Python
+    scalars are first converted into a numpy array, which is faster than building the
+    tensor from the list. Lists of Python scalars or of CPU tensors
+    going to a CUDA device are staged in pinned memory, so that the host to device
+    transfer can be asynchronous.
+
+    Tensors that are already on the device and of the given type are returned without
+    any work. Note that the returned tensor may share memory with the input if no type
+    or device conversion is needed. The conversion is dispatched on the type of the
+    input.
+
+    Parameters
+    ----------
+    x : Union[List[torch.Tensor], torch.Tensor, np.ndarray, List[Union[int, float]],
+    Union[int, float]]
+        Input to be converted.
+    device : torch.device
+        Device to which the tensor should be moved.
+    dtype : torch.dtype
+        Data type to which the tensor should be converted.
+
+    Returns
+    -------
+    torch.Tensor
+        Converted tensor.
+    """
+    is_cuda = _is_cuda(device)
+    if dtype in _TORCH_TO_NP:
+        # The array is built without a data type so that invalid elements, such as
+        # None, are not silently cast. Anything that is not a numeric array is left
+        # to torch.tensor, which raises the appropriate error.
+        try:
+            array = np.asarray(x)
+        except (ValueError, TypeError, RuntimeError):
+            array = None
+        if array is not None and array.dtype.kind in "biuf":
+            tensor = torch.from_numpy(array)
+            if is_cuda:
+                tensor = tensor.pin_memory()
+            return tensor.to(device=device, dtype=dtype, non_blocking=is_cuda)
+    return torch.tensor(x, dtype=dtype, device=device)
+
+
+@_to_device_dtype.register
+def _(x: torch.Tensor, device, dtype):
+    # A tensor already on the device with the right type is returned as is
+    if (device is None or x.device == torch.device(device)) and x.dtype == dtype:
+        return x
+    return x.to(device=device, dtype=dtype, non_blocking=_is_cuda(device))
+
+
+@_to_device_dtype.register
+def _(x: np.ndarray, device, dtype):
+    tensor = torch.from_numpy(np.ascontiguousarray(x))
+    return tensor.to(device=device, dtype=dtype, non_blocking=_is_cuda(device))
+
+
+@_to_device_dtype.register
+def _(x: list, device, dtype):
+    # Empty lists and lists of Python scalars are handled by the default
+    # implementation
+    if len(x) == 0 or not torch.is_tensor(x[0]):
+        return _to_device_dtype.dispatch(object)(x, device, dtype)
+    is_cuda = _is_cuda(device)
+    if (
+        is_cuda
+        and not x[0].is_cuda
+        and not (torch.is_grad_enabled() and any(t.requires_grad for t in x))
+    ):
+        return _stack_pinned_to(x, device, dtype)
+    return torch.stack(x).to(device=device, dtype=dtype, non_blocking=is_cuda)
 
 
 def tfloat(x, device, float_type):
@@ -489,12 +757,81 @@ def tfloat(x, device, float_type):
     Union[torch.Tensor, List[torch.Tensor]]
         Float tensor.
     """
-    if isinstance(x, list) and torch.is_tensor(x[0]):
-        return torch.stack(x).to(device=device, dtype=float_type)
-    if torch.is_tensor(x):
-        return x.to(device=device, dtype=float_type)
-    else:
-        return torch.tensor(x, dtype=float_type, device=device)
+    return _to_device_dtype(x, device, float_type)
+
+
+def tfloat_reshape(x, device, float_type, shape):
+    """
+    Convert input to a float tensor with the given shape.
+
+    For tensors that need a type or device conversion, the output tensor is allocated
+    on the device with its final shape and type and the input is copied into it at
+    once, instead of converting the input and then reshaping it. Other inputs are
+    converted as in :py:func:`tfloat` and then reshaped, which returns a view of
+    tensors that are already on the device and of the given type.
+
+    Parameters
+    ----------
+    x : Union[List[torch.Tensor], torch.Tensor, np.ndarray, List[Union[int, float]],
+    Union[int, float]]
+        Input to be converted to a float tensor.
+    device : torch.device
+        Device to which the tensor should be moved.
+    float_type : torch.dtype
+        Float type to which the tensor should be converted.
+    shape : Tuple[int]
+        Shape of the resulting tensor. It must have as many elements as the input and
+        may contain -1 for one inferred dimension, as in :py:meth:`torch.reshape`.
+
+    Returns
+    -------
+    torch.Tensor
+        Float tensor.
+    """
+    if torch.is_tensor(x) and (
+        x.dtype != float_type
+        or (device is not None and x.device != torch.device(device))
+    ):
+        # The view checks the shape against the number of elements of the input, as
+        # reshape does, before anything is copied
+        result = torch.empty(x.numel(), dtype=float_type, device=device).view(shape)
+        result.view(-1).copy_(x.reshape(-1), non_blocking=_is_cuda(device))
+        return result
+    return _to_device_dtype(x, device, float_type).reshape(shape)
+
+
+def tfloat_list(x, device, float_type):
+    """
+    Convert a list of tensors into a list of float tensors, without stacking them.
+
+    The tensors are copied into the specified device and float type with a single
+    call to :py:func:`torch._foreach_copy_`, which can launch a single kernel for the
+    whole list rather than one per tensor. The resulting tensors are detached from the
+    computational graph.
+
+    Parameters
+    ----------
+    x : List[torch.Tensor]
+        List of tensors to be converted.
+    device : torch.device
+        Device to which the tensors should be moved.
+    float_type : torch.dtype
+        Float type to which the tensors should be converted.
+
+    Returns
+    -------
+    List[torch.Tensor]
+        List of float tensors.
+    """
+    if len(x) == 0:
+        return []
+    result = [torch.empty(el.shape, dtype=float_type, device=device) for el in x]
+    torch._foreach_copy_(
+        result,
+        [el.detach() for el in x],
+        non_blocking=_is_cuda(device),
+    )
+    return result
 
 
 def tlong(x, device):
@@ -517,12 +854,7 @@ def tlong(x, device):
     Union[torch.Tensor, List[torch.Tensor]]
         Long tensor.
     """
-    if isinstance(x, list) and torch.is_tensor(x[0]):
-        return torch.stack(x).to(device=device, dtype=torch.long)
-    if torch.is_tensor(x):
-        return x.to(device=device, dtype=torch.long)
-    else:
-        return torch.tensor(x, dtype=torch.long, device=device)
+    return _to_device_dtype(x, device, torch.long)
 
 
 def tint(x, device, int_type):
@@ -547,12 +879,7 @@ def tint(x, device, int_type):
     Union[torch.Tensor, List[torch.Tensor]]
         Integer tensor.
     """
-    if isinstance(x, list) and torch.is_tensor(x[0]):
-        return torch.stack(x).to(device=device, dtype=int_type)
-    if torch.is_tensor(x):
-        return x.to(device=device, dtype=int_type)
-    else:
-        return torch.tensor(x, dtype=int_type, device=device)
+    return _to_device_dtype(x, device, int_type)
 
 
 def tbool(x, device):
@@ -575,18 +902,30 @@ def tbool(x, device):
     Union[torch.Tensor, List[torch.Tensor]]
         Boolean tensor.
     """
-    if isinstance(x, list) and torch.is_tensor(x[0]):
-        return torch.stack(x).to(device=device, dtype=torch.bool)
-    if torch.is_tensor(x):
-        return x.to(device=device, dtype=torch.bool)
-    else:
-        return torch.tensor(x, dtype=torch.bool, device=device)
+    return _to_device_dtype(x, device, torch.bool)
 
 
-def concat_items(list_of_items, indices=None):
+def _concat_out(list_of_items, out_buffer):
+    """
+    Returns the first rows of out_buffer in which to concatenate the items, or None if
+    no buffer is passed or it has fewer rows than the concatenation.
+    """
+    if out_buffer is None:
+        return None
+    n_total = sum(item.shape[0] for item in list_of_items)
+    if out_buffer.shape[0] < n_total:
+        return None
+    return out_buffer[:n_total]
+
+
+def concat_items(list_of_items, indices=None, out_buffer=None):
     """
     Concatenates a list of items into a single tensor or array.
 
+    If a large enough tensor or array is passed as out_buffer, the items are
+    concatenated into its first rows, which avoids allocating a new output for every
+    call with items of the same shape.
+
     Parameters
     ----------
     list_of_items :
@@ -594,6 +933,10 @@ def concat_items(list_of_items, indices=None):
     indices : Union[List[np.ndarray], List[torch.Tensor]], optional
         Indices to select in the resulting concatenated tensor or array, by default
         None.
+    out_buffer : Union[np.ndarray, torch.Tensor], optional
+        Pre-allocated array or tensor of the same type as the items in which to write
+        the concatenation, by default None. Ignored if it has fewer rows than the
+        concatenation.
 
     Returns
     -------
@@ -607,14 +950,27 @@ def concat_items(list_of_items, indices=None):
         tensors.
     """
     if isinstance(list_of_items[0], np.ndarray):
-        result = np.concatenate(list_of_items)
+        out = _concat_out(list_of_items, out_buffer)
+        if out is None:
+            result = np.concatenate(list_of_items)
+        else:
+            result = np.concatenate(list_of_items, out=out)
         if indices is not None:
-            if torch.is_tensor(indices[0]):
-                indices = indices.cpu().numpy()
+            # A tensor of indices is copied to the host at once, which is the only
+            # synchronization with the device
+            if torch.is_tensor(indices):
+                indices = indices.contiguous().cpu().numpy()
             result = result[indices]
     elif torch.is_tensor(list_of_items[0]):
-        result = torch.cat(list_of_items)
+        out = _concat_out(list_of_items, out_buffer)
+        if out is None:
+            result = torch.cat(list_of_items)
+        else:
+            result = torch.cat(list_of_items, out=out)
         if indices is not None:
+            # The indexing is performed on the device of the concatenated tensor
+            if torch.is_tensor(indices):
+                indices = indices.to(result.device)
             result = result[indices]
     else:
         raise NotImplementedError(
@@ -624,12 +980,47 @@ def concat_items(list_of_items, indices=None):
     return result
 
 
+def _fits_buffer(out_buffer, n_total, *tensors):
+    """
+    Returns True if out_buffer can hold the concatenation of the tensors, that is if
+    it has at least n_total rows and the same data type, device and trailing
+    dimensions as all the tensors.
+    """
+    if out_buffer is None or out_buffer.shape[0] < n_total:
+        return False
+    return all(
+        tensor.dtype == out_buffer.dtype
+        and tensor.device == out_buffer.device
+        and tensor.shape[1:] == out_buffer.shape[1:]
+        for tensor in tensors
+    )
+
+
 def extend(
-    orig: Union[List, TensorType["..."]], new: Union[List, TensorType["..."]]
+    orig: Union[List, TensorType["..."]],
+    new: Union[List, TensorType["..."]],
+    out_buffer: Optional[TensorType["..."]] = None,
 ) -> Union[List, TensorType["..."]]:
     """
     Extends the original list or tensor with the new list or tensor.
 
+    Tensors are concatenated along the first dimension. If a large enough buffer is
+    passed as out_buffer, with the same data type, device and trailing dimensions as
+    the tensors, the result is written into its first rows and a view of the buffer
+    is returned, which avoids allocating a new tensor for every extension. If orig is
+    already the view of the first rows of the buffer, only the new tensor is copied.
+
+    Parameters
+    ----------
+    orig : Union[List, TensorType["..."]]
+        Original list or tensor.
+    new : Union[List, TensorType["..."]]
+        List or tensor to append to the original one.
+    out_buffer : TensorType["..."], optional
+        Pre-allocated tensor in which to write the extended tensor, by default None.
+        Ignored for lists, if it has fewer rows than the extended tensor or if its
+        data type, device or trailing dimensions differ from those of the tensors.
+
     Returns
     -------
     Union[List, TensorType["..."]]
@@ -643,8 +1034,28 @@ def extend(
     assert isinstance(orig, type(new))
     if isinstance(orig, list):
         orig.extend(new)
-    elif torch.tensor(orig):
-        orig = torch.cat([orig, new])
+    elif torch.is_tensor(orig):
+        n_orig = orig.shape[0]
+        n_total = n_orig + new.shape[0]
+        if not _fits_buffer(out_buffer, n_total, orig, new):
+            orig = torch.cat([orig, new])
+        else:
+            prefix = out_buffer[:n_orig]
+            # Inputs that share memory with the buffer are cloned before writing
+            # into it, so that they are not overwritten while they are copied.
+            buffer_ptr = out_buffer.untyped_storage().data_ptr()
+            orig_in_place = (
+                orig.data_ptr() == prefix.data_ptr()
+                and orig.stride() == prefix.stride()
+            )
+            if orig.untyped_storage().data_ptr() == buffer_ptr and not orig_in_place:
+                orig = orig.clone()
+            if new.untyped_storage().data_ptr() == buffer_ptr:
+                new = new.clone()
+            if not orig_in_place:
+                prefix.copy_(orig)
+            out_buffer[n_orig:n_total].copy_(new)
+            orig = out_buffer[:n_total]
     else:
         raise NotImplementedError(
             "Extension only supported for lists and torch tensors"
@@ -656,7 +1067,8 @@ def copy(x: Union[List, TensorType["..."]]):
     """
     Makes copy of the input tensor or list.
 
-    A tensor is cloned and detached from the computational graph.
+    A tensor is cloned and detached from the computational graph. Lists and tuples of
+    tensors are copied by cloning each tensor, which avoids the overhead of deepcopy.
 
     Parameters
     ----------
@@ -669,7 +1081,9 @@ def copy(x: Union[List, TensorType["..."]]):
         Copy of the input tensor or list.
     """
     if torch.is_tensor(x):
-        return x.clone().detach()
+        return x.detach().clone()
+    if type(x) in (list, tuple) and x and all(torch.is_tensor(el) for el in x):
+        return type(x)(el.detach().clone() for el in x)
     else:
         return deepcopy(x)
 
@@ -680,13 +1094,12 @@ def bootstrap_samples(tensor, num_samples):
     returns tensor of the shape [initial_shape, num_samples]
     """
     dim_size = tensor.size(-1)
+    out_shape = tensor.size()[:-1] + (dim_size, num_samples)
+    # The same bootstrap indices are used for all the leading dimensions
     bs_indices = torch.randint(
-        0, dim_size, size=(num_samples * dim_size,), device=tensor.device
-    )
-    bs_samples = torch.index_select(tensor, -1, index=bs_indices)
-    bs_samples = bs_samples.view(
-        tensor.size()[:-1] + (num_samples, dim_size)
-    ).transpose(-1, -2)
+        0, dim_size, size=(num_samples, dim_size), device=tensor.device
+    ).T.expand(out_shape)
+    bs_samples = tensor.unsqueeze(-1).expand(out_shape).gather(-2, bs_indices)
     return bs_samples
 
 
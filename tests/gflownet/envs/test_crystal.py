@@ -6,7 +6,6 @@ this one but have been removed for simplicity. Check commit
 to that commit to consult previous implementations.
 """
 
-import warnings
 from collections import Counter
 
 import common
@@ -43,6 +42,93 @@ SG_SUBSET_ALL_CLS_PS = [
 ]
 
 
+def _decompose(env, state, stage=None):
+    """
+    Returns the stage of a state, or the stage passed as an argument, together with
+    the corresponding sub-environment, its sub-state and the slice of its part of the
+    mask of the Stack.
+    """
+    if stage is None:
+        stage = env._get_stage(state)
+    subenv = env.subenvs[stage]
+    mask_slice = slice(env.n_subenvs, env.n_subenvs + subenv.mask_dim)
+    return stage, subenv, env._get_substate(state, stage), mask_slice
+
+
+def _get_substate_indices(env, state):
+    """
+    Returns the index of the sub-state of each stage in a state of the Stack, obtained
+    with env._get_substate on the list of indices of the elements of the state.
+    """
+    indices = list(range(len(state)))
+    return {stage: env._get_substate(indices, stage) for stage in env.subenvs}
+
+
+def _get_masks_and_policy_outputs(env, states, is_backward):
+    """
+    Returns the masks of invalid actions of a batch of states and the random policy
+    outputs tiled for the batch.
+    """
+    # Important: we need to set the state of the environment before computing the
+    # mask because otherwise the environment can have wrong attributes, such as
+    # self.space_group. The environment has no batched masks method, but the mask of
+    # a state equal to the previous one is reused without setting it.
+    masks = []
+    for idx, state in enumerate(states):
+        if idx > 0 and env.equal(state, states[idx - 1]):
+            masks.append(masks[-1])
+            continue
+        env.reset()
+        env.set_state(state, done=False)
+        if is_backward:
+            masks.append(env.get_mask_invalid_actions_backward())
+        else:
+            masks.append(env.get_mask_invalid_actions_forward())
+    masks = tbool(masks, device=env.device)
+    policy_outputs = torch.tile(
+        env.get_policy_output(env.random_distr_params), dims=(len(states), 1)
+    )
+    return masks, policy_outputs
+
+
+def _get_masks_and_policy_outputs_repeated(cache, request, env, states, is_backward):
+    """
+    Returns the masks and policy outputs of _get_masks_and_policy_outputs, computed
+    once for all the repetitions of a parametrized test.
+
+    The cache is indexed by the name of the test and its parametrize id without the
+    part added by pytest-repeat. Clones are returned, so that the cached tensors are
+    not modified by the tests.
+    """
+    callspec = request.node.callspec
+    param_id = callspec.id
+    if "__pytest_repeat_step_number" in callspec.params:
+        param_id = param_id.rsplit("-", 2)[0]
+    key = (request.node.originalname, param_id)
+    if key not in cache:
+        cache[key] = _get_masks_and_policy_outputs(env, states, is_backward)
+    masks, policy_outputs = cache[key]
+    return masks.clone(), policy_outputs.clone()
+
+
+def _replay(env, actions, backward=False):
+    """
+    Applies a sequence of actions to the environment, forward or backward, and returns
+    the list of flags indicating whether each action was valid.
+    """
+    step = env.step_backwards if backward else env.step
+    return [step(action)[2] for action in actions]
+
+
+@pytest.fixture(scope="module")
+def masks_and_policy_outputs_cache():
+    """
+    Masks and policy outputs of the batches of states of the repeated sampling tests,
+    which are cleared at the end of the module.
+    """
+    return {}
+
+
 @pytest.fixture
 def env_mini_comp_first():
     return Crystal(
@@ -193,13 +279,12 @@ def test__source_is_expected(env, source, request):
 )
 def test__action_space__contains_actions_of_all_subenvs(env, request):
     env = request.getfixturevalue(env)
-    action_space = env.action_space
+    # Actions are tuples, so membership can be checked in a set
+    action_space = frozenset(env.action_space)
     for stage, subenv in env.subenvs.items():
         assert all(
-            [
-                env._pad_action(action, stage) in action_space
-                for action in subenv.action_space
-            ]
+            env._pad_action(action, stage) in action_space
+            for action in subenv.action_space
         )
 
 
@@ -229,20 +314,21 @@ def test__action_space__contains_actions_of_all_subenvs(env, request):
 def test__states2policy__is_concatenation_of_subenv_states(env, states, request):
     env = request.getfixturevalue(env)
     # Get policy states from the batch of states converted into each subenv
-    states_dict = {stage: [] for stage in env.subenvs}
-    for state in states:
-        for stage in env.subenvs:
-            states_dict[stage].append(env._get_substate(state, stage))
+    # The batch is transposed once into columns, which are indexed by the position of
+    # the sub-state of each stage in the Stack state
+    substates = list(zip(*states))
+    states_dict = {
+        stage: list(substates[idx])
+        for stage, idx in _get_substate_indices(env, states[0]).items()
+    }
     states_policy_dict = {
         stage: subenv.states2policy(states_dict[stage])
         for stage, subenv in env.subenvs.items()
     }
-    states_policy_expected = torch.cat(
-        [el for el in states_policy_dict.values()], dim=1
-    )
+    states_policy_expected = torch.cat(tuple(states_policy_dict.values()), dim=1)
     # Get policy states from env.states2policy
     states_policy = env.states2policy(states)
-    assert torch.all(torch.eq(states_policy, states_policy_expected))
+    assert torch.equal(states_policy, states_policy_expected)
 
 
 @pytest.mark.skip(reason="skip until revised")
@@ -272,18 +358,21 @@ def test__states2policy__is_concatenation_of_subenv_states(env, states, request)
 def test__states2proxy__is_concatenation_of_subenv_states(env, states, request):
     env = request.getfixturevalue(env)
     # Get proxy states from the batch of states converted into each subenv
-    states_dict = {stage: [] for stage in env.subenvs}
-    for state in states:
-        for stage in env.subenvs:
-            states_dict[stage].append(env._get_substate(state, stage))
+    # The batch is transposed once into columns, which are indexed by the position of
+    # the sub-state of each stage in the Stack state
+    substates = list(zip(*states))
+    states_dict = {
+        stage: list(substates[idx])
+        for stage, idx in _get_substate_indices(env, states[0]).items()
+    }
     states_proxy_dict = {
         stage: subenv.states2proxy(states_dict[stage])
         for stage, subenv in env.subenvs.items()
     }
-    states_proxy_expected = torch.cat([el for el in states_proxy_dict.values()], dim=1)
+    states_proxy_expected = torch.cat(tuple(states_proxy_dict.values()), dim=1)
     # Get proxy states from env.states2proxy
     states_proxy = env.states2proxy(states)
-    assert torch.all(torch.eq(states_proxy, states_proxy_expected))
+    assert torch.equal(states_proxy, states_proxy_expected)
 
 
 @pytest.mark.parametrize(
@@ -334,24 +423,6 @@ def test__states2proxy__is_concatenation_of_subenv_states(env, states, request):
                 [-1, -1, -1, -1, -1, -1],
             ),
         ],
-        [
-            "env_mini_comp_first",
-            [1, {1: 1, 3: 4}, [4, 3, 105], [-1, -1, -1, -1, -1, -1]],
-            (
-                {1: 1, 3: 4},
-                [4, 3, 105],
-                [-1, -1, -1, -1, -1, -1],
-            ),
-        ],
-        [
-            "env_mini_comp_first",
-            [2, {1: 1, 3: 4}, [4, 3, 105], [-1, -1, -1, -1, -1, -1]],
-            (
-                {1: 1, 3: 4},
-                [4, 3, 105],
-                [-1, -1, -1, -1, -1, -1],
-            ),
-        ],
         [
             "env_mini_comp_first",
             [2, {1: 1, 3: 4}, [4, 3, 105], [-1, -1, -1, -1, -1, -1]],
@@ -370,24 +441,6 @@ def test__states2proxy__is_concatenation_of_subenv_states(env, states, request):
                 [0.1, 0.2, 0.3, 0.4, 0.5, 0.6],
             ),
         ],
-        [
-            "env_mini_comp_first",
-            [2, {1: 1, 3: 4}, [4, 3, 105], [0.1, 0.2, 0.3, 0.4, 0.5, 0.6]],
-            (
-                {1: 1, 3: 4},
-                [4, 3, 105],
-                [0.1, 0.2, 0.3, 0.4, 0.5, 0.6],
-            ),
-        ],
-        [
-            "env_mini_comp_first",
-            [2, {1: 1, 3: 4}, [4, 3, 105], [0.76, 0.75, 0.74, 0.73, 0.72, 0.71]],
-            (
-                {1: 1, 3: 4},
-                [4, 3, 105],
-                [0.76, 0.75, 0.74, 0.73, 0.72, 0.71],
-            ),
-        ],
         [
             "env_mini_comp_first",
             [2, {1: 1, 3: 4}, [4, 3, 105], [0.76, 0.75, 0.74, 0.73, 0.72, 0.71]],
@@ -716,13 +769,11 @@ def test__get_mask_invalid_actions_backward__returns_expected_general_case(
 ):
     env = request.getfixturevalue(env)
     env.set_state(state, done=False)
-    n_stages = env.n_subenvs
-    stage = env._get_stage(state)
-    subenv = env.subenvs[stage]
+    _, subenv, substate, mask_slice = _decompose(env, state)
     mask = env.get_mask_invalid_actions_backward()
-    mask_subenv = mask[n_stages : n_stages + subenv.mask_dim]
+    mask_subenv = mask[mask_slice]
     mask_subenv_expected = subenv.get_mask_invalid_actions_backward(
-        env._get_substate(state, stage), done=False
+        substate, done=False
     )
     assert mask_subenv == mask_subenv_expected, state
 
@@ -755,20 +806,18 @@ def test__get_mask_invalid_actions_backward__returns_expected_stage_transition(
     env, state, request
 ):
     env = request.getfixturevalue(env)
-    env.set_state(state, done=False)
-    n_stages = env.n_subenvs
     stage = env._get_stage(state)
+    # States in the first stage are only checked against the source, which does not
+    # require setting the state
     if stage == 0:
         assert env.equal(state, env.source)
         return
-    stage -= 1
-    subenv = env.subenvs[stage]
+    env.set_state(state, done=False)
+    stage, subenv, substate, mask_slice = _decompose(env, state, stage - 1)
     mask = env.get_mask_invalid_actions_backward(state, done=False)
     assert mask[stage]
-    mask_subenv = mask[n_stages : n_stages + subenv.mask_dim]
-    mask_subenv_expected = subenv.get_mask_invalid_actions_backward(
-        env._get_substate(state, stage), done=True
-    )
+    mask_subenv = mask[mask_slice]
+    mask_subenv_expected = subenv.get_mask_invalid_actions_backward(substate, done=True)
     assert mask_subenv == mask_subenv_expected, state
 
 
@@ -871,36 +920,10 @@ def test__transitions_from_space_group_to_composition_apply_constraints_correctl
     assert env.space_group.lattice_system == env.lattice_parameters.lattice_system
 
 
+@pytest.mark.filterwarnings("ignore")
 @pytest.mark.parametrize(
     "env, actions, exp_result, last_action_valid",
     [
-        (
-            "env_mini_comp_first",
-            [(0, 1, 1, 0, 0, 0, 0, 0), (0, 3, 4, 0, 0, 0, 0, 0)],
-            [0, {1: 1, 3: 4}, [0, 0, 0], [-1, -1, -1, -1, -1, -1]],
-            True,
-        ),
-        (
-            "env_mini_comp_first",
-            [
-                (0, 1, 1, 0, 0, 0, 0, 0),
-                (0, 3, 4, 0, 0, 0, 0, 0),
-                (0, -1, -1, 0, 0, 0, 0, 0),
-            ],
-            [1, {1: 1, 3: 4}, [0, 0, 0], [-1, -1, -1, -1, -1, -1]],
-            True,
-        ),
-        (
-            "env_mini_comp_first",
-            [
-                (0, 1, 1, 0, 0, 0, 0, 0),
-                (0, 3, 4, 0, 0, 0, 0, 0),
-                (0, -1, -1, 0, 0, 0, 0, 0),
-                (1, 2, 105, 0, 0, 0, 0, 0),
-            ],
-            [1, {1: 1, 3: 4}, [4, 3, 105], [-1, -1, -1, -1, -1, -1]],
-            True,
-        ),
         (
             "env_mini_comp_first",
             [
@@ -913,18 +936,6 @@ def test__transitions_from_space_group_to_composition_apply_constraints_correctl
             [1, {1: 1, 3: 4}, [4, 3, 105], [-1, -1, -1, -1, -1, -1]],
             False,
         ),
-        (
-            "env_mini_comp_first",
-            [
-                (0, 1, 1, 0, 0, 0, 0, 0),
-                (0, 3, 4, 0, 0, 0, 0, 0),
-                (0, -1, -1, 0, 0, 0, 0, 0),
-                (1, 2, 105, 0, 0, 0, 0, 0),
-                (1, -1, -1, -1, 0, 0, 0, 0),
-            ],
-            [2, {1: 1, 3: 4}, [4, 3, 105], [-1, -1, -1, -1, -1, -1]],
-            True,
-        ),
         (
             "env_mini_comp_first",
             [
@@ -966,39 +977,12 @@ def test__transitions_from_space_group_to_composition_apply_constraints_correctl
             [2, {1: 1, 3: 4}, [4, 3, 105], [0.76, 0.76, 0.74, 0.4, 0.4, 0.4]],
             True,
         ),
-        (
-            "env_mini_comp_first",
-            [
-                (0, 1, 1, 0, 0, 0, 0, 0),
-                (0, 3, 4, 0, 0, 0, 0, 0),
-                (0, -1, -1, 0, 0, 0, 0, 0),
-                (1, 2, 105, 0, 0, 0, 0, 0),
-                (1, -1, -1, -1, 0, 0, 0, 0),
-                (2, 0.1, 0.1, 0.3, 0.0, 0.0, 0.0, 1),
-                (2, 0.66, 0.66, 0.44, 0.0, 0.0, 0.0, 0),
-                (2, np.inf, np.inf, np.inf, np.inf, np.inf, np.inf, np.inf),
-            ],
-            [2, {1: 1, 3: 4}, [4, 3, 105], [0.76, 0.76, 0.74, 0.4, 0.4, 0.4]],
-            True,
-        ),
-        (
-            "env_sg_first",
-            [(0, 2, 105, 0, 0, 0, 0, 0)],
-            [0, [4, 3, 105], {}, [-1, -1, -1, -1, -1, -1]],
-            True,
-        ),
         (
             "env_sg_first",
             [(0, 2, 105, 0, 0, 0, 0, 0), (0, 2, 105, 0, 0, 0, 0, 0)],
             [0, [4, 3, 105], {}, [-1, -1, -1, -1, -1, -1]],
             False,
         ),
-        (
-            "env_sg_first",
-            [(0, 2, 105, 0, 0, 0, 0, 0), (0, -1, -1, -1, 0, 0, 0, 0)],
-            [1, [4, 3, 105], {}, [-1, -1, -1, -1, -1, -1]],
-            True,
-        ),
         (
             "env_sg_first",
             [
@@ -1009,18 +993,6 @@ def test__transitions_from_space_group_to_composition_apply_constraints_correctl
             [1, [4, 3, 105], {3: 4}, [-1, -1, -1, -1, -1, -1]],
             True,
         ),
-        (
-            "env_sg_first",
-            [
-                (0, 2, 105, 0, 0, 0, 0, 0),
-                (0, -1, -1, -1, 0, 0, 0, 0),
-                (1, 1, 2, 0, 0, 0, 0, 0),
-                (1, 3, 4, 0, 0, 0, 0, 0),
-                (1, -1, -1, 0, 0, 0, 0, 0),
-            ],
-            [2, [4, 3, 105], {1: 2, 3: 4}, [-1, -1, -1, -1, -1, -1]],
-            True,
-        ),
         (
             "env_sg_first",
             [
@@ -1049,39 +1021,94 @@ def test__transitions_from_space_group_to_composition_apply_constraints_correctl
             [2, [4, 3, 105], {1: 2, 3: 4}, [0.76, 0.76, 0.74, 0.4, 0.4, 0.4]],
             True,
         ),
+    ],
+)
+def test__step__action_sequence_has_expected_result(
+    env, actions, exp_result, last_action_valid, request
+):
+    env = request.getfixturevalue(env)
+    valids = _replay(env, actions)
+    assert all(valids[:-1]), "Invalid action"
+
+    assert env.equal(env.state, exp_result)
+    assert valids[-1] == last_action_valid
+
+
+# Each case is a single sequence of valid actions, paired with the expected state after
+# each action, or None if the intermediate state is not checked. The action sequences
+# of test__step__action_sequence_has_expected_result which are prefixes of these ones
+# are tested here in a single pass.
+@pytest.mark.filterwarnings("ignore")
+@pytest.mark.parametrize(
+    "env, actions_and_states",
+    [
+        (
+            "env_mini_comp_first",
+            [
+                ((0, 1, 1, 0, 0, 0, 0, 0), None),
+                (
+                    (0, 3, 4, 0, 0, 0, 0, 0),
+                    [0, {1: 1, 3: 4}, [0, 0, 0], [-1, -1, -1, -1, -1, -1]],
+                ),
+                (
+                    (0, -1, -1, 0, 0, 0, 0, 0),
+                    [1, {1: 1, 3: 4}, [0, 0, 0], [-1, -1, -1, -1, -1, -1]],
+                ),
+                (
+                    (1, 2, 105, 0, 0, 0, 0, 0),
+                    [1, {1: 1, 3: 4}, [4, 3, 105], [-1, -1, -1, -1, -1, -1]],
+                ),
+                (
+                    (1, -1, -1, -1, 0, 0, 0, 0),
+                    [2, {1: 1, 3: 4}, [4, 3, 105], [-1, -1, -1, -1, -1, -1]],
+                ),
+                ((2, 0.1, 0.1, 0.3, 0.0, 0.0, 0.0, 1), None),
+                ((2, 0.66, 0.66, 0.44, 0.0, 0.0, 0.0, 0), None),
+                (
+                    (2, np.inf, np.inf, np.inf, np.inf, np.inf, np.inf, np.inf),
+                    [2, {1: 1, 3: 4}, [4, 3, 105], [0.76, 0.76, 0.74, 0.4, 0.4, 0.4]],
+                ),
+            ],
+        ),
         (
             "env_sg_first",
             [
-                (0, 2, 105, 0, 0, 0, 0, 0),
-                (0, -1, -1, -1, 0, 0, 0, 0),
-                (1, 1, 2, 0, 0, 0, 0, 0),
-                (1, 3, 4, 0, 0, 0, 0, 0),
-                (1, -1, -1, 0, 0, 0, 0, 0),
-                (2, 0.1, 0.1, 0.3, 0.0, 0.0, 0.0, 1),
-                (2, 0.66, 0.66, 0.44, 0.0, 0.0, 0.0, 0),
-                (2, np.inf, np.inf, np.inf, np.inf, np.inf, np.inf, np.inf),
+                (
+                    (0, 2, 105, 0, 0, 0, 0, 0),
+                    [0, [4, 3, 105], {}, [-1, -1, -1, -1, -1, -1]],
+                ),
+                (
+                    (0, -1, -1, -1, 0, 0, 0, 0),
+                    [1, [4, 3, 105], {}, [-1, -1, -1, -1, -1, -1]],
+                ),
+                ((1, 1, 2, 0, 0, 0, 0, 0), None),
+                ((1, 3, 4, 0, 0, 0, 0, 0), None),
+                (
+                    (1, -1, -1, 0, 0, 0, 0, 0),
+                    [2, [4, 3, 105], {1: 2, 3: 4}, [-1, -1, -1, -1, -1, -1]],
+                ),
+                ((2, 0.1, 0.1, 0.3, 0.0, 0.0, 0.0, 1), None),
+                ((2, 0.66, 0.66, 0.44, 0.0, 0.0, 0.0, 0), None),
+                (
+                    (2, np.inf, np.inf, np.inf, np.inf, np.inf, np.inf, np.inf),
+                    [2, [4, 3, 105], {1: 2, 3: 4}, [0.76, 0.76, 0.74, 0.4, 0.4, 0.4]],
+                ),
             ],
-            [2, [4, 3, 105], {1: 2, 3: 4}, [0.76, 0.76, 0.74, 0.4, 0.4, 0.4]],
-            True,
         ),
     ],
 )
-def test__step__action_sequence_has_expected_result(
-    env, actions, exp_result, last_action_valid, request
+def test__step__action_sequence_has_expected_intermediate_results(
+    env, actions_and_states, request
 ):
     env = request.getfixturevalue(env)
-    for idx, action in enumerate(actions):
-        warnings.filterwarnings("ignore")
+    for action, exp_result in actions_and_states:
         _, _, valid = env.step(action)
-        if idx == len(actions) - 1 and not last_action_valid:
-            assert not valid
-        else:
-            assert valid, "Invalid action"
-
-    assert env.equal(env.state, exp_result)
-    assert valid == last_action_valid
+        assert valid, "Invalid action"
+        if exp_result is not None:
+            assert env.equal(env.state, exp_result)
 
 
+@pytest.mark.filterwarnings("ignore")
 @pytest.mark.parametrize(
     "env, state_init, state_end, actions, last_action_valid",
     [
@@ -1240,12 +1267,10 @@ def test__step_backwards__action_sequence_has_expected_result(
     else:
         env.set_state(state_init, done=False)
     assert env.equal(env.state, state_init)
-    for action in actions:
-        warnings.filterwarnings("ignore")
-        _, _, valid = env.step_backwards(action)
+    valids = _replay(env, actions, backward=True)
 
     assert env.equal(env.state, state_end)
-    assert valid == last_action_valid
+    assert valids[-1] == last_action_valid
 
 
 @pytest.mark.parametrize(
@@ -1281,8 +1306,7 @@ def test__step_backwards__action_sequence_has_expected_result(
 )
 def test__reset__sets_source_and_triclinic(env, actions, request):
     env = request.getfixturevalue(env)
-    for action in actions:
-        env.step(action)
+    _replay(env, actions)
 
     assert env.state != env.source
     for subenv in env.subenvs.values():
@@ -1429,22 +1453,14 @@ def test__step_random__does_not_crash_from_source(env, request):
         ),
     ],
 )
-def test__sample_actions_forward__returns_valid_actions(env, states, request):
+def test__sample_actions_forward__returns_valid_actions(
+    env, states, request, masks_and_policy_outputs_cache
+):
     env = request.getfixturevalue(env)
-    n_states = len(states)
-    # Get masks
-    # Important: we need to set the state of the environment before computing
-    # the mask because otherwise the environment can have wrong attributes,
-    # such as self.space_group
-    masks = []
-    for state in states:
-        env.reset()
-        env.set_state(state, done=False)
-        masks.append(env.get_mask_invalid_actions_forward())
-    masks = tbool(masks, device=env.device)
-    # Build policy outputs
-    params = env.random_distr_params
-    policy_outputs = torch.tile(env.get_policy_output(params), dims=(n_states, 1))
+    # Get masks and policy outputs
+    masks, policy_outputs = _get_masks_and_policy_outputs_repeated(
+        masks_and_policy_outputs_cache, request, env, states, is_backward=False
+    )
     # Sample actions
     actions, _ = env.sample_actions_batch(
         policy_outputs, masks, states, is_backward=False
@@ -1513,21 +1529,14 @@ def test__sample_actions_forward__returns_valid_actions(env, states, request):
         ),
     ],
 )
-def test__sample_actions_backward__returns_valid_actions(env, states, request):
+def test__sample_actions_backward__returns_valid_actions(
+    env, states, request, masks_and_policy_outputs_cache
+):
     env = request.getfixturevalue(env)
-    n_states = len(states)
-    # Get masks
-    # Important: we need to set the state of the environment before computing
-    # the mask because otherwise the environment can have wrong attributes,
-    # such as self.space_group
-    masks = []
-    for state in states:
-        env.set_state(state, done=False)
-        masks.append(env.get_mask_invalid_actions_backward())
-    masks = tbool(masks, device=env.device)
-    # Build policy outputs
-    params = env.random_distr_params
-    policy_outputs = torch.tile(env.get_policy_output(params), dims=(n_states, 1))
+    # Get masks and policy outputs
+    masks, policy_outputs = _get_masks_and_policy_outputs_repeated(
+        masks_and_policy_outputs_cache, request, env, states, is_backward=True
+    )
     # Sample actions
     actions, _ = env.sample_actions_batch(
         policy_outputs, masks, states, is_backward=True
@@ -1613,20 +1622,11 @@ def test__get_logprobs_forward__returns_valid_actions(
     env_mini_comp_first, states, actions
 ):
     env = env_mini_comp_first
-    n_states = len(states)
     actions = tfloat(actions, float_type=env.float, device=env.device)
-    # Get masks
-    # Important: we need to set the state of the environment before computing
-    # the mask because otherwise the environment can have wrong attributes,
-    # such as self.space_group
-    masks = []
-    for state in states:
-        env.set_state(state, done=False)
-        masks.append(env.get_mask_invalid_actions_forward())
-    masks = tbool(masks, device=env.device)
-    # Build policy outputs
-    params = env.random_distr_params
-    policy_outputs = torch.tile(env.get_policy_output(params), dims=(n_states, 1))
+    # Get masks and policy outputs
+    masks, policy_outputs = _get_masks_and_policy_outputs(
+        env, states, is_backward=False
+    )
     # Get log probs
     logprobs = env.get_logprobs(
         policy_outputs, actions, masks, states, is_backward=False
@@ -1701,20 +1701,9 @@ def test__get_logprobs_backward__returns_valid_actions(
     env_mini_comp_first, states, actions
 ):
     env = env_mini_comp_first
-    n_states = len(states)
     actions = tfloat(actions, float_type=env.float, device=env.device)
-    # Get masks
-    # Important: we need to set the state of the environment before computing
-    # the mask because otherwise the environment can have wrong attributes,
-    # such as self.space_group
-    masks = []
-    for state in states:
-        env.set_state(state, done=False)
-        masks.append(env.get_mask_invalid_actions_backward())
-    masks = tbool(masks, device=env.device)
-    # Build policy outputs
-    params = env.random_distr_params
-    policy_outputs = torch.tile(env.get_policy_output(params), dims=(n_states, 1))
+    # Get masks and policy outputs
+    masks, policy_outputs = _get_masks_and_policy_outputs(env, states, is_backward=True)
     # Get log probs
     logprobs = env.get_logprobs(
         policy_outputs, actions, masks, states, is_backward=True
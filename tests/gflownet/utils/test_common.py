@@ -0,0 +1,399 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+import torch
+
+import gflownet.utils.common as common
+from gflownet.utils.common import (
+    batch_with_rest,
+    concat_items,
+    extend,
+    find_latest_checkpoint,
+    load_gflownet_from_rundir,
+    read_hydra_config,
+    tbool,
+    tfloat,
+    tfloat_list,
+    tfloat_reshape,
+    tint,
+    tlong,
+)
+
+requires_cuda = pytest.mark.skipif(
+    not torch.cuda.is_available(), reason="requires a CUDA device"
+)
+
+
+@pytest.fixture
+def pinned_buffers(monkeypatch):
+    """
+    Empties the cache of pinned buffers for the duration of a test.
+    """
+    monkeypatch.setattr(common, "_PINNED_BUFFERS", OrderedDict())
+    return common._PINNED_BUFFERS
+
+
+@pytest.mark.parametrize(
+    "func, args, dtype",
+    [
+        (tfloat, (torch.float32,), torch.float32),
+        (tfloat, (torch.float64,), torch.float64),
+        (tlong, (), torch.int64),
+        (tint, (torch.int16,), torch.int16),
+        (tbool, (), torch.bool),
+    ],
+)
+def test__t_helpers__convert_lists_of_scalars_and_tensors(func, args, dtype):
+    expected = torch.tensor([[0, 1], [2, 3]]).to(dtype)
+    # List of Python scalars
+    result = func([[0, 1], [2, 3]], "cpu", *args)
+    assert result.dtype == dtype
+    assert torch.equal(result, expected)
+    # List of tensors, which are stacked
+    result = func([torch.tensor([0, 1]), torch.tensor([2, 3])], "cpu", *args)
+    assert result.dtype == dtype
+    assert torch.equal(result, expected)
+    # Empty list
+    result = func([], "cpu", *args)
+    assert result.dtype == dtype
+    assert result.shape == (0,)
+
+
+@pytest.mark.parametrize(
+    "func, args, dtype",
+    [
+        (tfloat, (torch.float32,), torch.float32),
+        (tlong, (), torch.int64),
+        (tint, (torch.int16,), torch.int16),
+        (tbool, (), torch.bool),
+    ],
+)
+@pytest.mark.parametrize(
+    "x",
+    [
+        [0, 1],
+        np.array([0, 1]),
+        torch.tensor([0, 1]),
+        [torch.tensor(0), torch.tensor(1)],
+        1,
+    ],
+)
+def test__t_helpers__accept_none_device(func, args, dtype, x):
+    result = func(x, None, *args)
+    assert result.dtype == dtype
+    assert torch.equal(result, torch.as_tensor(np.asarray(x)).to(dtype))
+
+
+@pytest.mark.parametrize(
+    "func, args",
+    [
+        (tfloat, (torch.float32,)),
+        (tlong, ()),
+        (tint, (torch.int32,)),
+        (tbool, ()),
+    ],
+)
+def test__t_helpers__raise_on_none_elements(func, args):
+    with pytest.raises(TypeError):
+        func([1, None], "cpu", *args)
+
+
+@pytest.mark.filterwarnings("ignore:Converting a tensor with requires_grad")
+def test__tfloat__converts_tuple_of_tensors_requiring_grad():
+    x = (torch.tensor(1.0, requires_grad=True), torch.tensor(2.0))
+    result = tfloat(x, "cpu", torch.float32)
+    assert torch.equal(result, torch.tensor([1.0, 2.0]))
+
+
+@pytest.mark.parametrize(
+    "func, args, dtype",
+    [
+        (tfloat, (torch.float32,), torch.float32),
+        (tlong, (), torch.int64),
+        (tint, (torch.int16,), torch.int16),
+        (tbool, (), torch.bool),
+    ],
+)
+def test__t_helpers__return_tensors_without_conversion_as_is(func, args, dtype):
+    x = torch.zeros(3, dtype=dtype)
+    assert func(x, "cpu", *args) is x
+
+
+def test__tfloat__shares_memory_with_numpy_array_of_same_type():
+    x = np.arange(4, dtype=np.float32)
+    result = tfloat(x, "cpu", torch.float32)
+    x[0] = 10.0
+    assert result[0] == 10.0
+    # A conversion of type makes a copy
+    result = tfloat(x, "cpu", torch.float64)
+    x[1] = 20.0
+    assert result[1] == 1.0
+
+
+def test__tfloat_list__converts_type_without_stacking():
+    x = [torch.arange(3, dtype=torch.int64), torch.ones(2, 2, dtype=torch.float64)]
+    result = tfloat_list(x, "cpu", torch.float32)
+    assert isinstance(result, list)
+    assert [el.dtype for el in result] == [torch.float32, torch.float32]
+    assert [el.shape for el in result] == [(3,), (2, 2)]
+    assert torch.equal(result[0], torch.tensor([0.0, 1.0, 2.0]))
+    assert torch.equal(result[1], torch.ones(2, 2))
+    assert tfloat_list([], "cpu", torch.float32) == []
+
+
+def test__tfloat_list__returns_copies_detached_from_graph():
+    x = [torch.ones(2, requires_grad=True)]
+    result = tfloat_list(x, "cpu", torch.float32)
+    assert not result[0].requires_grad
+    result[0][0] = 5.0
+    assert x[0][0] == 1.0
+
+
+@requires_cuda
+def test__tfloat_list__moves_tensors_to_device():
+    x = [torch.arange(3), torch.arange(4)]
+    result = tfloat_list(x, torch.device("cuda"), torch.float16)
+    assert all(el.is_cuda and el.dtype == torch.float16 for el in result)
+    assert torch.equal(result[1].cpu(), torch.arange(4, dtype=torch.float16))
+
+
+def test__extend__concatenates_tensors_and_lists():
+    result = extend(torch.zeros(2, 3), torch.ones(1, 3))
+    assert torch.equal(result, torch.cat([torch.zeros(2, 3), torch.ones(1, 3)]))
+    orig = [1, 2]
+    assert extend(orig, [3]) is orig
+    assert orig == [1, 2, 3]
+
+
+def test__extend__writes_into_buffer_prefix():
+    buffer = torch.full((5, 2), -1.0)
+    orig = torch.zeros(2, 2)
+    result = extend(orig, torch.ones(1, 2), out_buffer=buffer)
+    assert result.data_ptr() == buffer.data_ptr()
+    assert torch.equal(result, torch.tensor([[0.0, 0.0], [0.0, 0.0], [1.0, 1.0]]))
+    # The original tensor is already the prefix of the buffer: only the new rows are
+    # written and the result is still a view of the buffer
+    result = extend(result, torch.full((2, 2), 2.0), out_buffer=buffer)
+    assert result.data_ptr() == buffer.data_ptr()
+    assert result.shape == (5, 2)
+    assert torch.equal(result[3:], torch.full((2, 2), 2.0))
+    assert torch.equal(result[:3], torch.tensor([[0.0, 0.0], [0.0, 0.0], [1.0, 1.0]]))
+
+
+def test__extend__ignores_too_small_buffer():
+    buffer = torch.full((2, 2), -1.0)
+    result = extend(torch.zeros(2, 2), torch.ones(1, 2), out_buffer=buffer)
+    assert result.data_ptr() != buffer.data_ptr()
+    assert result.shape == (3, 2)
+    assert torch.equal(buffer, torch.full((2, 2), -1.0))
+
+
+@pytest.mark.parametrize(
+    "buffer",
+    [
+        torch.full((5, 2), -1, dtype=torch.long),
+        torch.full((5, 3), -1.0),
+    ],
+)
+def test__extend__ignores_incompatible_buffer(buffer):
+    orig = torch.full((1, 2), 0.7)
+    new = torch.full((1, 2), 1.6)
+    result = extend(orig, new, out_buffer=buffer)
+    assert result.data_ptr() != buffer.data_ptr()
+    assert torch.equal(result, torch.cat([orig, new]))
+    assert torch.all(buffer == -1)
+
+
+def test__extend__copies_views_of_buffer_safely():
+    buffer = torch.arange(10.0).reshape(5, 2)
+    # orig is a view of the buffer, but not of its first rows
+    result = extend(buffer[1:3], buffer[0:1], out_buffer=buffer)
+    assert result.data_ptr() == buffer.data_ptr()
+    assert torch.equal(result, torch.tensor([[2.0, 3.0], [4.0, 5.0], [0.0, 1.0]]))
+    # new is a view of the rows of the buffer that are written
+    buffer = torch.arange(10.0).reshape(5, 2)
+    result = extend(buffer[:2], buffer[1:3], out_buffer=buffer)
+    expected = torch.tensor([[0.0, 1.0], [2.0, 3.0], [2.0, 3.0], [4.0, 5.0]])
+    assert torch.equal(result, expected)
+
+
+def test__extend__raises_on_mismatched_types():
+    with pytest.raises(AssertionError):
+        extend([1], torch.ones(1))
+
+
+@pytest.mark.parametrize(
+    "items",
+    [
+        [np.zeros((2, 2)), np.ones((1, 2))],
+        [torch.zeros(2, 2), torch.ones(1, 2)],
+    ],
+)
+def test__concat_items__writes_into_large_enough_buffer(items):
+    if torch.is_tensor(items[0]):
+        buffer = torch.full((4, 2), -1.0)
+    else:
+        buffer = np.full((4, 2), -1.0)
+    result = concat_items(items, out_buffer=buffer)
+    assert result.shape == (3, 2)
+    assert np.array_equal(np.asarray(buffer[:3]), np.asarray(result))
+    assert np.array_equal(np.asarray(result), [[0, 0], [0, 0], [1, 1]])
+    # With indices, the selection is applied to the concatenation
+    result = concat_items(items, indices=[2, 0], out_buffer=buffer)
+    assert np.array_equal(np.asarray(result), [[1, 1], [0, 0]])
+    # A buffer that is too small is ignored
+    small = buffer[:2]
+    result = concat_items(items, out_buffer=small)
+    assert result.shape == (3, 2)
+    assert np.array_equal(np.asarray(buffer[3]), [-1, -1])
+
+
+def test__concat_items__raises_on_unsupported_types():
+    with pytest.raises(NotImplementedError):
+        concat_items([[1, 2], [3]])
+
+
+@pytest.mark.parametrize("tensor", [False, True])
+def test__batch_with_rest__yields_all_indices_in_batches(tensor):
+    batches = list(batch_with_rest(2, 9, 3, tensor=tensor))
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    assert all(torch.is_tensor(batch) == tensor for batch in batches)
+    assert np.array_equal(np.concatenate([np.asarray(b) for b in batches]), range(2, 9))
+    assert list(batch_with_rest(5, 3, 2, tensor=tensor)) == []
+
+
+@requires_cuda
+def test__batch_with_rest__allocates_indices_on_device():
+    batches = list(batch_with_rest(0, 5, 2, tensor=True, device="cuda"))
+    assert all(batch.is_cuda for batch in batches)
+    assert torch.equal(torch.cat(batches).cpu(), torch.arange(5))
+
+
+def test__tfloat_reshape__returns_view_if_no_conversion_is_needed():
+    x = torch.arange(6, dtype=torch.float32)
+    result = tfloat_reshape(x, device="cpu", float_type=torch.float32, shape=(2, 3))
+    assert result.shape == (2, 3)
+    assert result.data_ptr() == x.data_ptr()
+
+
+@pytest.mark.parametrize(
+    "x",
+    [
+        torch.arange(6, dtype=torch.float64),
+        torch.arange(6, dtype=torch.int64),
+        np.arange(6.0),
+        np.arange(6.0)[::-1].copy()[::-1],
+        list(range(6)),
+    ],
+)
+def test__tfloat_reshape__converts_and_reshapes(x):
+    result = tfloat_reshape(x, device="cpu", float_type=torch.float32, shape=(3, 2))
+    assert result.dtype == torch.float32
+    assert torch.equal(result, torch.arange(6, dtype=torch.float32).reshape(3, 2))
+
+
+@pytest.mark.parametrize("dtype", [torch.float32, torch.int64])
+def test__tfloat_reshape__infers_dimension_and_validates_shape(dtype):
+    x = torch.arange(6, dtype=dtype)
+    result = tfloat_reshape(x, device="cpu", float_type=torch.float32, shape=(-1, 2))
+    assert result.shape == (3, 2)
+    assert torch.equal(result, torch.arange(6, dtype=torch.float32).reshape(3, 2))
+    with pytest.raises(RuntimeError):
+        tfloat_reshape(x[:1], device="cpu", float_type=torch.float32, shape=(2, 3))
+
+
+def test__tfloat_reshape__handles_negative_strides():
+    x = np.arange(6.0)[::-1]
+    result = tfloat_reshape(x, device="cpu", float_type=torch.float32, shape=(2, 3))
+    expected = torch.tensor([[5.0, 4.0, 3.0], [2.0, 1.0, 0.0]])
+    assert torch.equal(result, expected)
+
+
+@requires_cuda
+def test__stack_pinned_to__reuses_buffer_and_returns_stacked_tensor(pinned_buffers):
+    x = [torch.full((3,), float(idx)) for idx in range(4)]
+    result = common._stack_pinned_to(x, torch.device("cuda"), torch.float32)
+    assert len(pinned_buffers) == 1
+    buffer, _ = next(iter(pinned_buffers.values()))
+    assert buffer.is_pinned()
+    # A second call with the same shape writes into the same buffer once the first
+    # transfer is complete, without modifying the first result
+    y = [torch.full((3,), float(-idx)) for idx in range(4)]
+    result_y = common._stack_pinned_to(y, torch.device("cuda"), torch.float64)
+    assert len(pinned_buffers) == 1
+    assert next(iter(pinned_buffers.values()))[0].data_ptr() == buffer.data_ptr()
+    assert torch.equal(result.cpu(), torch.stack(x))
+    assert torch.equal(result_y.cpu(), torch.stack(y).double())
+    assert result_y.dtype == torch.float64
+
+
+@requires_cuda
+def test__stack_pinned_to__limits_number_and_size_of_buffers(
+    pinned_buffers, monkeypatch
+):
+    monkeypatch.setattr(common, "_PINNED_BUFFERS_MAX", 2)
+    monkeypatch.setattr(common, "_PINNED_BUFFERS_MAX_BYTES", 4 * 10)
+    device = torch.device("cuda")
+    for n in range(1, 4):
+        common._stack_pinned_to([torch.zeros(n)], device, torch.float32)
+    # Only the two most recent buffers are kept, given the limit on their number
+    assert [key[0] for key in pinned_buffers] == [(1, 2), (1, 3)]
+    # Buffers larger than the size limit are not kept
+    result = common._stack_pinned_to([torch.ones(11)], device, torch.float32)
+    assert (1, 11) not in [key[0] for key in pinned_buffers]
+    assert torch.equal(result.cpu(), torch.ones(1, 11))
+
+
+def test__read_hydra_config__rereads_modified_run_config(tmp_path):
+    hydra_dir = tmp_path / ".hydra"
+    hydra_dir.mkdir()
+    (hydra_dir / "config.yaml").write_text("a: 1\n")
+    config = read_hydra_config(rundir=tmp_path)
+    assert config.a == 1
+    # The returned config is a copy of the cached one
+    config.a = 10
+    assert read_hydra_config(rundir=tmp_path).a == 1
+    (hydra_dir / "config.yaml").write_text("a: 2\n")
+    os.utime(hydra_dir / "config.yaml", ns=(0, 0))
+    assert read_hydra_config(rundir=tmp_path).a == 2
+
+
+def test__read_hydra_config__tracks_files_in_defaults_list(tmp_path, monkeypatch):
+    (tmp_path / "main.yaml").write_text("defaults:\n  - sub\n  - _self_\nb: 2\n")
+    (tmp_path / "sub.yaml").write_text("c: 3\n")
+    monkeypatch.chdir(tmp_path)
+    assert read_hydra_config(config_name="main.yaml") == {"b": 2, "c": 3}
+    (tmp_path / "sub.yaml").write_text("c: 4\n")
+    assert read_hydra_config(config_name="main.yaml") == {"b": 2, "c": 4}
+
+
+def test__find_latest_checkpoint__sees_new_checkpoints(tmp_path):
+    with pytest.raises(ValueError):
+        find_latest_checkpoint(tmp_path / "missing")
+    (tmp_path / "iter_2.ckpt").touch()
+    (tmp_path / "iter_10.ckpt").touch()
+    assert find_latest_checkpoint(tmp_path) == tmp_path / "iter_10.ckpt"
+    # Files written without a change of the modification time of the directory
+    mtime = tmp_path.stat().st_mtime_ns
+    (tmp_path / "final.ckpt").touch()
+    os.utime(tmp_path, ns=(mtime, mtime))
+    assert find_latest_checkpoint(tmp_path) == tmp_path / "final.ckpt"
+
+
+@pytest.mark.parametrize("device", ["cpu", torch.device("cpu")])
+def test__load_gflownet_from_rundir__sets_device_in_config(
+    tmp_path, monkeypatch, device
+):
+    hydra_dir = tmp_path / ".hydra"
+    hydra_dir.mkdir()
+    (hydra_dir / "config.yaml").write_text(
+        "device: cuda\nlogger:\n  do:\n    online: true\n"
+    )
+    monkeypatch.setattr(common, "gflownet_from_config", lambda config: None)
+    _, config = load_gflownet_from_rundir(
+        tmp_path, device=device, load_last_checkpoint=False
+    )
+    assert config.device == "cpu"
+    assert config.logger.do.online is False